@@ -1,115 +1,171 @@
-import unittest
 import asyncio
+import unittest
 from wander import Wandbox
 
-
-class TestWanderMethods(unittest.TestCase):
-
-	def test_connect(self):
-
-		async def coro():
-			inst = Wandbox()
-			self.assertTrue(inst.session is not None)
-
-		asyncio.run(coro())
-
-	def test_list(self):
-
-		async def coro():
-			inst = Wandbox()
-			x = await inst.compilers()
-			self.assertTrue(isinstance(x, list))
-
-		asyncio.run(coro())
-
-	def test_permlink(self):
-
-		async def coro():
-			inst = Wandbox()
-			x = await inst.get_permlink(link="axZAlgGHXxxMY18o")
-			self.assertTrue(isinstance(x, dict))
-
-		asyncio.run(coro())
-
-	def test_template(self):
-
-		async def coro():
-			inst = Wandbox()
-			x = await inst.get_template(name="gcc")
-			self.assertTrue(isinstance(x, str), msg=x)
-
-		asyncio.run(coro())
-
-	def test_compile_simple(self):
-
-		async def coro():
-			inst = Wandbox()
-
-			code = "import os\nprint(os.name)\nprint('done')"
-			x = await inst.compile(
-				code=code,
-				compiler='cpython-3.8.0',
-				compiler_option_raw=False,
-				runtime_option_raw=True
-			)
-			keys = ('program_message', 'program_output', 'status')
-			self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
-
-		asyncio.run(coro())
-
-	def test_compile_save(self):
-
-		async def coro():
-			inst = Wandbox()
-
-			code = "import os\nprint(os.name)\nprint('done')"
-			x = await inst.compile(
-				code=code,
-				compiler='cpython-3.8.0',
-				compiler_option_raw=False,
-				runtime_option_raw=True,
-				save=True
-			)
-			keys = ('program_message', 'program_output', 'status', 'permlink', 'url')
-			self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
-
-		asyncio.run(coro())
-
-	def test_compile_codes(self):
-
-		async def coro():
-			inst = Wandbox()
-
-			codes = [{'file': 'demo.py', 'code': "import os\nname=os.name\nsecret=os.cpu_count()"}]
-			code = "import demo\nprint(demo.name, demo.secret)\nprint('done')"
-			x = await inst.compile(
-				code=code,
-				codes=codes,
-				compiler='cpython-3.8.0',
-				compiler_option_raw=False,
-				runtime_option_raw=True
-			)
-			keys = ('program_message', 'program_output', 'status')
-			self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
-
-		asyncio.run(coro())
-
-	def test_compile_nd_simple(self):
-
-		async def coro():
-			inst = Wandbox()
-
-			code = "import os\nprint(os.name)\nprint('done')"
-			x = await inst.compile_nd(
-				code=code,
-				compiler='cpython-3.8.0',
-				compiler_option_raw=False,
-				runtime_option_raw=True
-			)
-			keys = ['data', 'type']
-			self.assertTrue(all(sorted(doc.keys()) == keys for doc in x), msg=f"{keys}\n-----\n{x}")
-
-		asyncio.run(coro())
+try:
+	import httpx
+	HAS_HTTPX = True
+except ImportError:
+	HAS_HTTPX = False
+
+
+# IsolatedAsyncioTestCase creates a fresh event loop per test method, so the shared
+# session cannot outlive a single test and each one pays its own TLS handshake.
+# Deliberate tradeoff: the suite stays on stdlib unittest (the repo has no pytest
+# configuration or dev dependencies) at the cost of the cross-test session reuse a
+# session-scoped pytest-asyncio loop would give. Teardown must close the session in
+# the same loop, hence the per-test aclose().
+class TestWanderMethods(unittest.IsolatedAsyncioTestCase):
+
+	async def asyncSetUp(self):
+		self.inst = Wandbox()
+
+	async def asyncTearDown(self):
+		await Wandbox.aclose()
+
+	async def test_connect(self):
+		session = await self.inst.get_session()
+		self.assertTrue(session is not None)
+		self.assertTrue(session is await Wandbox.get_session())
+
+	def test_bad_backend(self):
+		with self.assertRaises(ValueError):
+			Wandbox(backend='requests')
+
+	async def test_list(self):
+		x = await self.inst.compilers()
+		self.assertTrue(isinstance(x, list))
+
+	async def test_list_cached(self):
+		first = await self.inst.compilers()
+		second = await self.inst.compilers()
+		self.assertIs(second, first)
+		refreshed = await self.inst.compilers(refresh=True)
+		self.assertIsNot(refreshed, first)
+		self.assertTrue(isinstance(refreshed, list))
+		expired = await self.inst.compilers(ttl=0)
+		self.assertIsNot(expired, refreshed)
+
+	async def test_template_cached(self):
+		first = await self.inst.get_template(name="gcc")
+		second = await self.inst.get_template(name="gcc")
+		self.assertIs(second, first)
+
+	async def test_cache_single_flight(self):
+		calls = []
+
+		async def fetch():
+			calls.append(1)
+			await asyncio.sleep(0)
+			return 'value'
+
+		results = await asyncio.gather(*(self.inst._cached('single-flight', None, False, fetch) for _ in range(5)))
+		self.assertTrue(all(r == 'value' for r in results))
+		self.assertEqual(len(calls), 1)
+
+	async def test_permlink(self):
+		x = await self.inst.get_permlink(link="axZAlgGHXxxMY18o")
+		self.assertTrue(isinstance(x, dict))
+
+	async def test_template(self):
+		x = await self.inst.get_template(name="gcc")
+		# get_template indexes the response's 'code' key directly; these fail loudly
+		# (KeyError upstream, or here) if the endpoint's shape ever changes
+		self.assertTrue(isinstance(x, str), msg=x)
+		self.assertNotEqual(x, '', msg="template endpoint returned an empty template")
+
+	async def test_compile_simple(self):
+		code = "import os\nprint(os.name)\nprint('done')"
+		x = await self.inst.compile(
+			code=code,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True
+		)
+		keys = ('program_message', 'program_output', 'status')
+		self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
+
+	async def test_compile_save(self):
+		code = "import os\nprint(os.name)\nprint('done')"
+		x = await self.inst.compile(
+			code=code,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True,
+			save=True
+		)
+		keys = ('program_message', 'program_output', 'status', 'permlink', 'url')
+		self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
+
+	async def test_compile_codes(self):
+		codes = [{'file': 'demo.py', 'code': "import os\nname=os.name\nsecret=os.cpu_count()"}]
+		code = "import demo\nprint(demo.name, demo.secret)\nprint('done')"
+		x = await self.inst.compile(
+			code=code,
+			codes=codes,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True
+		)
+		keys = ('program_message', 'program_output', 'status')
+		self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
+
+	async def test_compile_many(self):
+		jobs = [
+			{'code': f"print({i})", 'compiler': 'cpython-3.8.0'}
+			for i in range(4)
+		]
+		results = await self.inst.compile_many(jobs, concurrency=2)
+		self.assertEqual(len(results), len(jobs))
+		for i, result in enumerate(results):
+			self.assertEqual(result.get('program_output'), f"{i}\n", msg=result)
+
+	async def test_compile_nd_simple(self):
+		code = "import os\nprint(os.name)\nprint('done')"
+		x = await self.inst.compile_nd(
+			code=code,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True
+		)
+		keys = ['data', 'type']
+		self.assertTrue(all(sorted(doc.keys()) == keys for doc in x), msg=f"{keys}\n-----\n{x}")
+
+
+@unittest.skipUnless(HAS_HTTPX, "requires the optional httpx[http2] dependency")
+class TestWanderHttpxMethods(unittest.IsolatedAsyncioTestCase):
+
+	async def asyncSetUp(self):
+		self.inst = Wandbox(backend='httpx')
+
+	async def asyncTearDown(self):
+		await Wandbox.aclose()
+
+	async def test_list(self):
+		x = await self.inst.compilers(refresh=True)
+		self.assertTrue(isinstance(x, list))
+
+	async def test_compile_simple(self):
+		code = "import os\nprint(os.name)\nprint('done')"
+		x = await self.inst.compile(
+			code=code,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True
+		)
+		keys = ('program_message', 'program_output', 'status')
+		self.assertTrue(sorted(x.keys()) == sorted(keys), msg=f"{x}\n-----\n{keys}")
+
+	async def test_compile_nd_simple(self):
+		code = "import os\nprint(os.name)\nprint('done')"
+		x = await self.inst.compile_nd(
+			code=code,
+			compiler='cpython-3.8.0',
+			compiler_option_raw=False,
+			runtime_option_raw=True
+		)
+		keys = ['data', 'type']
+		self.assertTrue(all(sorted(doc.keys()) == keys for doc in x), msg=f"{keys}\n-----\n{x}")
 
 
 if __name__ == "__main__":
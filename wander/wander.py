@@ -1,93 +1,246 @@
 import aiohttp
 import asyncio
-import atexit
-import json
-import ndjson
+import orjson
+import ssl
+import time
+import types
 import typing
 
+# Built once at import so every connection reuses the same verified TLS context
+_SSL_CONTEXT = ssl.create_default_context()
+
+# Header dicts are identical on every call; build them once and share read-only views
+_JSON_HEADERS = types.MappingProxyType({'Content-type': 'application/json', 'Accept': 'text/plain'})
+_NDJSON_HEADERS = types.MappingProxyType({'Content-type': 'application/x-ndjson', 'Accept': 'text/plain'})
+
+# Shared default for sequence parameters; always filtered out of payloads
+_EMPTY: typing.Final[tuple] = ()
+
 
 class Wandbox(object):
     url = "https://wandbox.org/api/{0}"
-    active = []
-
-    def __init__(self):
+    _LIST_URL = url.format("list.json")
+    _COMPILE_URL = url.format("compile.json")
+    _COMPILE_ND_URL = url.format("compile.ndjson")
+    _PERMLINK_URL = url.format("permlink")
+    _PERMLINK_PREFIX = url.format("permlink/")
+    _TEMPLATE_PREFIX = url.format("template/")
+    _USER_URL = url.format("url.json")
+    cache_ttl = 600.0
+    _loop: typing.Optional[asyncio.AbstractEventLoop] = None
+    _session: typing.Optional[aiohttp.ClientSession] = None
+    _session_lock: typing.Optional[asyncio.Lock] = None
+    _cache: typing.Dict[str, typing.Tuple[float, typing.Any]] = {}
+    _fetch_locks: typing.Dict[str, asyncio.Lock] = {}
+    _httpx_client = None
+    _httpx_lock: typing.Optional[asyncio.Lock] = None
+
+    # Shared state lives on the class; instances carry only their backend choice
+    __slots__ = ('backend',)
+
+    def __init__(self, backend: str = 'aiohttp'):
         """
-        Instantiate an aiohttp session unique to the instance
+        Lightweight handle to the Wandbox API. Performs no I/O; the HTTP client shared by
+        all instances is created lazily on the first request.
 
+        :param backend: 'aiohttp' (default, HTTP/1.1 with keep-alive) or 'httpx'
+                        (HTTP/2, multiplexes concurrent requests over one connection;
+                        requires the optional httpx[http2] dependency)
         """
-        self.session = None
-        self.connect()
+        if backend not in ('aiohttp', 'httpx'):
+            raise ValueError(f"unknown backend: {backend!r}")
+        self.backend = backend
 
-    def connect(self):
+    @classmethod
+    def _bind_loop(cls):
         """
-        Creates an aiohttp session for handling Wandbox API communication
+        Binds the shared state to the current running loop. asyncio locks and client
+        sessions cannot be reused across loops, so when the loop changes (e.g. a second
+        asyncio.run in the same process) the locks are rebuilt and clients bound to the
+        old loop are abandoned for lazy recreation. Cached responses are plain data and
+        survive the rebind.
 
         :return:
         """
-        if self.session is None:
-            self.session: aiohttp.ClientSession = aiohttp.ClientSession()
-            Wandbox.active.append(self)
-        else:
-            if self.session.closed:
-                self.session = aiohttp.ClientSession()
-            if self not in Wandbox.active:
-                Wandbox.active.append(self)
+        loop = asyncio.get_running_loop()
+        if cls._loop is not loop:
+            cls._loop = loop
+            cls._session = None
+            cls._session_lock = asyncio.Lock()
+            cls._fetch_locks = {}
+            cls._httpx_client = None
+            cls._httpx_lock = asyncio.Lock()
+
+    @classmethod
+    async def get_session(cls) -> aiohttp.ClientSession:
+        """
+        Returns the aiohttp session shared by all instances, creating it on first use.
+        Reusing one session keeps the connection pool (and its keep-alive sockets) warm
+        across calls. The connector is tuned for the single wandbox.org host: bounded
+        per-host concurrency, cached DNS lookups, and long keep-alives.
 
-    async def close(self):
+        :return:    aiohttp.ClientSession
         """
-        Closes aiohttp session if still open
+        cls._bind_loop()
+        if cls._session is None or cls._session.closed:
+            async with cls._session_lock:
+                if cls._session is None or cls._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=32,
+                        limit_per_host=16,
+                        ttl_dns_cache=300,
+                        keepalive_timeout=75,
+                        enable_cleanup_closed=True,
+                        ssl=_SSL_CONTEXT
+                    )
+                    # No total timeout: compiles can legitimately run for minutes, but a
+                    # stalled connect or silent socket should not wedge the pool
+                    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+                    cls._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=timeout,
+                        # The API is stateless per call; a no-op jar skips cookie
+                        # scanning and header assembly on every request
+                        cookie_jar=aiohttp.DummyCookieJar(),
+                        json_serialize=lambda obj: orjson.dumps(obj).decode()
+                    )
+        return cls._session
+
+    @classmethod
+    async def get_httpx_client(cls):
+        """
+        Returns the httpx client shared by all httpx-backed instances, creating it on
+        first use. HTTP/2 multiplexes concurrent requests as streams over a single TLS
+        connection, so the client is capped at one socket.
+
+        :return:    httpx.AsyncClient
+        """
+        cls._bind_loop()
+        if cls._httpx_client is None or cls._httpx_client.is_closed:
+            async with cls._httpx_lock:
+                if cls._httpx_client is None or cls._httpx_client.is_closed:
+                    try:
+                        import httpx
+                    except ImportError as error:
+                        raise ImportError("the httpx backend requires the optional httpx[http2] dependency") from error
+                    cls._httpx_client = httpx.AsyncClient(
+                        http2=True,
+                        limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+                        timeout=httpx.Timeout(None, connect=10)
+                    )
+        return cls._httpx_client
+
+    @classmethod
+    async def aclose(cls):
+        """
+        Closes the shared clients if still open. Awaiting this from the caller's
+        own loop lets the connector finish its cleanup deterministically, unlike closing
+        from a second loop at interpreter exit.
 
         :return:
         """
-        if self.session is not None and not self.session.closed:
-            await self.session.close()
-            Wandbox.active.remove(self)
+        # Rebinding first abandons clients from a previous, dead loop; they cannot be
+        # closed from here and awaiting them would raise
+        cls._bind_loop()
+        if cls._httpx_client is not None and not cls._httpx_client.is_closed:
+            await cls._httpx_client.aclose()
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+            # Yield once so the connector's transports finish closing
+            await asyncio.sleep(0)
+
+    async def __aenter__(self) -> "Wandbox":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
 
     @staticmethod
     async def _parse_response(response: aiohttp.ClientResponse) -> typing.Any:
         """
-        Takes an aiohttp.ClientResponse object and converts content to Python primitives via json or ndjson
+        Takes an aiohttp.ClientResponse object and converts content to Python primitives.
+        JSON bodies decode in one pass with orjson; ndjson bodies decode line by line.
 
         :param response:
         :return:
         """
-        decoder = ndjson.Decoder if (response.content_type == 'application/x-ndjson') else json.JSONDecoder
-        # TODO: Appears to be a bug in response.get_encoding() when dealing with ndjson
-        charset = response.charset # if response.charset is not None else response.get_encoding()
-        return await response.json(content_type=response.content_type, loads=decoder().decode, encoding=charset)
+        raw = await response.read()
+        if response.content_type == 'application/x-ndjson':
+            return [orjson.loads(line) for line in raw.split(b'\n') if line.strip()]
+        return orjson.loads(raw)
 
-    async def _get(self, url, *args, **kwargs):
+    @staticmethod
+    def _parse_httpx_response(response) -> typing.Any:
         """
-        Performs GET request on given URL. Modifies aiohttp GET behavior with args and kwargs.
+        Takes an httpx.Response object and converts content to Python primitives.
+        Mirrors _parse_response for the httpx backend.
 
-        :param url:
-        :param args:
-        :param kwargs:
+        :param response:
         :return:
         """
-        # TODO: drop ssl keyword once bug fixed
-        async with self.session.get(*args, url=url, ssl=False, **kwargs) as response:
-            response.raise_for_status()
-            return await self._parse_response(response)
+        if response.headers.get('content-type', '').startswith('application/x-ndjson'):
+            return [orjson.loads(line) for line in response.content.split(b'\n') if line.strip()]
+        return orjson.loads(response.content)
 
-    async def _post(self, url, *args, **kwargs):
+    async def _request_httpx(self, method, url, **kwargs):
         """
-        Performs POST request on given URL. Modifies aiohttp POST behavior with args and kwargs.
+        Performs a request through the shared httpx client for httpx-backed instances.
+        The aiohttp path is inlined at each call site to avoid an extra coroutine frame.
 
+        :param method:
         :param url:
-        :param args:
         :param kwargs:
         :return:
         """
-        # TODO: drop ssl keyword once bug fixed
-        async with self.session.post(*args, url=url, ssl=False, **kwargs) as response:
-            response.raise_for_status()
-            return await self._parse_response(response)
+        client = await type(self).get_httpx_client()
+        response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return self._parse_httpx_response(response)
 
-    async def compilers(self, **kwargs) -> typing.List[typing.Dict[str, typing.Any]]:
+    async def _cached(self, key: str, ttl: typing.Optional[float], refresh: bool, fetch) -> typing.Any:
         """
-        Requests the compiler list at https://wandbox.org/api/list.json
+        Returns the cached value for key if fresher than ttl, else awaits fetch() and
+        caches the result. Fetches run under a per-key lock so concurrent callers of the
+        same endpoint share one in-flight request while misses on different endpoints
+        proceed in parallel.
+
+        :param key:     Cache key, unique per endpoint/argument pair
+        :param ttl:     Seconds before a cached value goes stale; defaults to cache_ttl
+        :param refresh: Bypass the cache and fetch regardless of freshness
+        :param fetch:   Zero-argument coroutine function performing the request
+        :return:
+        """
+        ttl = self.cache_ttl if ttl is None else ttl
+        if not refresh:
+            hit = self._cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < ttl:
+                return hit[1]
+        cls = type(self)
+        cls._bind_loop()
+        lock = cls._fetch_locks.get(key)
+        if lock is None:
+            lock = cls._fetch_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if not refresh:
+                hit = self._cache.get(key)
+                if hit is not None and time.monotonic() - hit[0] < ttl:
+                    return hit[1]
+            value = await fetch()
+            type(self)._cache[key] = (time.monotonic(), value)
+            return value
+
+    async def compilers(
+            self,
+            ttl: typing.Optional[float] = None,
+            refresh: bool = False,
+            **kwargs
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        Requests the compiler list at https://wandbox.org/api/list.json. The catalog
+        rarely changes, so results are cached in-process for ttl seconds.
 
+        :param ttl:     Seconds before the cached list goes stale; defaults to cache_ttl
+        :param refresh: Bypass the cache and refetch
         :param kwargs:  Keyword arguments to modify aiohttp ClientSession().get() method
         :return:        List of compiler data (dictionaries)
 
@@ -163,8 +316,15 @@ class Wandbox(object):
         ```
 
         """
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        return await self._get(url=self.url.format("list.json"), headers=headers, **kwargs)
+        async def fetch():
+            if self.backend == 'httpx':
+                return await self._request_httpx('GET', self._LIST_URL, headers=_JSON_HEADERS, **kwargs)
+            session = await type(self).get_session()
+            async with session.get(url=self._LIST_URL, headers=_JSON_HEADERS, **kwargs) as response:
+                response.raise_for_status()
+                return await self._parse_response(response)
+
+        return await self._cached('list.json', ttl, refresh, fetch)
 
     async def get_permlink(self, link: str, **kwargs) -> typing.Dict[str, typing.Any]:
         """
@@ -174,13 +334,27 @@ class Wandbox(object):
         :param kwargs:  Keyword arguments to modify aiohttp ClientSession().get() method
         :return:        Dictionary of compilation data
         """
-        return await self._get(url=self.url.format(f"permlink/{link}"), **kwargs)
+        if self.backend == 'httpx':
+            return await self._request_httpx('GET', self._PERMLINK_PREFIX + link, **kwargs)
+        session = await type(self).get_session()
+        async with session.get(url=self._PERMLINK_PREFIX + link, **kwargs) as response:
+            response.raise_for_status()
+            return await self._parse_response(response)
 
-    async def get_template(self, name: str, **kwargs) -> str:
+    async def get_template(
+            self,
+            name: str,
+            ttl: typing.Optional[float] = None,
+            refresh: bool = False,
+            **kwargs
+    ) -> str:
         """
-        Requests a sample of code given a compiler name
+        Requests a sample of code given a compiler name. Templates are static per
+        compiler, so results are cached in-process for ttl seconds.
 
         :param name:    Name of the compiler template
+        :param ttl:     Seconds before the cached template goes stale; defaults to cache_ttl
+        :param refresh: Bypass the cache and refetch
         :param kwargs:  Keyword arguments to modify aiohttp ClientSession().get() method
         :return:        String of code
 
@@ -189,8 +363,17 @@ class Wandbox(object):
         gcc_code == "// This file is a \"Hello, world!\" in C++ language by gcc for wandbox.\n#include <iostream>\n#include <cstdlib>\n\nint main()\n{\n    std::cout << \"Hello, Wandbox!\" << std::endl;\n}\n\n// C++ language references:\n//   https://msdn.microsoft.com/library/3bstk3k5.aspx\n//   http://www.cplusplus.com/\n//   https://isocpp.org/\n//   http://www.open-std.org/jtc1/sc22/wg21/\n\n// Boost libraries references:\n//   http://www.boost.org/doc/\n"
         ```
         """
-        code = await self._get(url=self.url.format(f"template/{name}"), **kwargs)
-        return code['code'] if isinstance(code, dict) else code
+        async def fetch():
+            if self.backend == 'httpx':
+                code = await self._request_httpx('GET', self._TEMPLATE_PREFIX + name, **kwargs)
+                return code['code']
+            session = await type(self).get_session()
+            async with session.get(url=self._TEMPLATE_PREFIX + name, **kwargs) as response:
+                response.raise_for_status()
+                code = await self._parse_response(response)
+                return code['code']
+
+        return await self._cached(f"template/{name}", ttl, refresh, fetch)
 
     async def get_user(self, session: str, **kwargs) -> typing.Dict[str, typing.Any]:
         """
@@ -205,13 +388,18 @@ class Wandbox(object):
         user == {"login":true,"username":"melpon"}
         ```
         """
-        return await self._get(url=self.url.format("url.json"), data=json.dumps({'session': session}), **kwargs)
+        if self.backend == 'httpx':
+            return await self._request_httpx('GET', self._USER_URL, json={'session': session}, **kwargs)
+        http = await type(self).get_session()
+        async with http.get(url=self._USER_URL, json={'session': session}, **kwargs) as response:
+            response.raise_for_status()
+            return await self._parse_response(response)
 
     async def compile(
             self,
             code: str,
             compiler: str,
-            codes: typing.List[dict] = (),
+            codes: typing.List[dict] = _EMPTY,
             compiler_option_raw: bool = False,
             options: str = '',
             runtime_option_raw: bool = False,
@@ -233,35 +421,75 @@ class Wandbox(object):
         :param kwargs:              Keyword arguments to modify aiohttp ClientSession().post() method
         :return:                    Dictionary
         """
+        # Omit empty/default values: Wandbox treats absent keys the same and the
+        # payload stays smaller
         params = {
-            'code': code,
-            'codes': codes,
-            'compiler': compiler,
-            'compiler-option-raw': compiler_option_raw,
-            'options': options,
-            'runtime-option-raw': runtime_option_raw,
-            'save': save,
-            'stdin': stdin
+            key: value
+            for key, value in (
+                ('code', code),
+                ('codes', codes),
+                ('compiler', compiler),
+                ('compiler-option-raw', compiler_option_raw),
+                ('options', options),
+                ('runtime-option-raw', runtime_option_raw),
+                ('save', save),
+                ('stdin', stdin)
+            )
+            if value not in (None, '', (), [])
         }
 
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        # Must update kwargs to prevent conflicting arguments
-        kwargs.update({'data': json.dumps(params), 'headers': headers})
-        return await self._post(url=self.url.format("compile.json"), **kwargs)
+        if self.backend == 'httpx':
+            return await self._request_httpx('POST', self._COMPILE_URL, json=params, headers=_JSON_HEADERS, **kwargs)
+        session = await type(self).get_session()
+        async with session.post(url=self._COMPILE_URL, json=params, headers=_JSON_HEADERS, **kwargs) as response:
+            response.raise_for_status()
+            return await self._parse_response(response)
 
-    async def compile_nd(
+    async def compile_many(
+            self,
+            jobs: typing.List[dict],
+            concurrency: int = 8
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        Sends several compilations concurrently through the shared session and returns
+        their results in job order. Concurrent requests reuse the keep-alive pool, so
+        wall-clock time drops roughly to len(jobs) / concurrency sequential calls.
+
+        :param jobs:        List of keyword-argument dictionaries for the compile() method
+        :param concurrency: Maximum compilations in flight at once. Keep at or below the
+                            connector's per-host limit (16) or requests queue on the pool
+        :return:            List of compilation dictionaries, one per job
+
+        ```
+        results = await Wandbox().compile_many([
+            {'code': "print('a')", 'compiler': 'cpython-3.8.0'},
+            {'code': "print('b')", 'compiler': 'cpython-3.8.0'}
+        ])
+        ```
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(job: dict):
+            async with semaphore:
+                return await self.compile(**job)
+
+        return await asyncio.gather(*(one(job) for job in jobs))
+
+    async def compile_nd_stream(
             self,
             code: str,
             compiler: str,
-            codes: typing.List[dict] = (),
+            codes: typing.List[dict] = _EMPTY,
             compiler_option_raw: typing.Any = '',
             options: str = '',
             runtime_option_raw: typing.Any = '',
             stdin: str = '',
             **kwargs
-    ):
+    ) -> typing.AsyncIterator[typing.Dict[str, typing.Any]]:
         """
-        Sends code to Wandbox to be compiled with the given parameters and returns performance/completion dictionaries.
+        Sends code to Wandbox to be compiled with the given parameters and yields
+        performance/completion dictionaries as Wandbox emits them. Events arrive while the
+        program is still running, so the first record is available long before completion.
 
         :param code:                Code to compile and execute
         :param compiler:            Compiler name as described by Wandbox
@@ -271,31 +499,90 @@ class Wandbox(object):
         :param runtime_option_raw:  ...
         :param stdin:               Data to feed into input calls from running program
         :param kwargs:              Keyword arguments to modify aiohttp ClientSession().post() method
-        :return:                    Requests.Response instance
+        :return:                    Asynchronous iterator of event dictionaries
+
+        ```
+        async for event in Wandbox().compile_nd_stream(code=code, compiler='cpython-3.8.0'):
+            print(event['type'], event['data'])
+        ```
         """
+        # Omit empty/default values: Wandbox treats absent keys the same and the
+        # payload stays smaller
         params = {
-            'code': code,
-            'codes': codes,
-            'compiler': compiler,
-            'compiler-option-raw': compiler_option_raw,
-            'options': options,
-            'runtime-option-raw': runtime_option_raw,
-            'stdin': stdin
+            key: value
+            for key, value in (
+                ('code', code),
+                ('codes', codes),
+                ('compiler', compiler),
+                ('compiler-option-raw', compiler_option_raw),
+                ('options', options),
+                ('runtime-option-raw', runtime_option_raw),
+                ('stdin', stdin)
+            )
+            if value not in (None, '', (), [])
         }
 
-        headers = {'Content-type': 'application/x-ndjson', 'Accept': 'text/plain'}
-        # Must update kwargs to prevent conflicting arguments
-        kwargs.update({'data': json.dumps(params), 'headers': headers})
-        return await self._post(url=self.url.format("compile.ndjson"), **kwargs)
+        if self.backend == 'httpx':
+            client = await type(self).get_httpx_client()
+            async with client.stream('POST', self._COMPILE_ND_URL, json=params, headers=_NDJSON_HEADERS, **kwargs) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        yield orjson.loads(line)
+            return
+        session = await type(self).get_session()
+        async with session.post(url=self._COMPILE_ND_URL, json=params, headers=_NDJSON_HEADERS, **kwargs) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if line.strip():
+                    yield orjson.loads(line)
+
+    async def compile_nd(
+            self,
+            code: str,
+            compiler: str,
+            codes: typing.List[dict] = _EMPTY,
+            compiler_option_raw: typing.Any = '',
+            options: str = '',
+            runtime_option_raw: typing.Any = '',
+            stdin: str = '',
+            **kwargs
+    ):
+        """
+        Sends code to Wandbox to be compiled with the given parameters and returns performance/completion dictionaries.
+        Thin wrapper around compile_nd_stream that collects every event before returning.
+
+        :param code:                Code to compile and execute
+        :param compiler:            Compiler name as described by Wandbox
+        :param codes:               List of supplementary code objects {'code': abcd..., 'file': 'demo.py'}
+        :param compiler_option_raw: ...
+        :param options:             Compiler options (as would be typed in terminal)
+        :param runtime_option_raw:  ...
+        :param stdin:               Data to feed into input calls from running program
+        :param kwargs:              Keyword arguments to modify aiohttp ClientSession().post() method
+        :return:                    List of event dictionaries
+        """
+        return [
+            event async for event in self.compile_nd_stream(
+                code=code,
+                compiler=compiler,
+                codes=codes,
+                compiler_option_raw=compiler_option_raw,
+                options=options,
+                runtime_option_raw=runtime_option_raw,
+                stdin=stdin,
+                **kwargs
+            )
+        ]
 
     async def post_permlink(
             self,
             code: str,
             compiler: str,
-            codes: typing.List[dict] = (),
+            codes: typing.List[dict] = _EMPTY,
             compiler_option_raw: str = '',
             options: str = '',
-            results: typing.List[dict] = (),
+            results: typing.List[dict] = _EMPTY,
             runtime_option_raw: str = '',
             stdin: str = '',
             **kwargs
@@ -314,32 +601,25 @@ class Wandbox(object):
         :param kwargs:              Keyword arguments to modify aiohttp ClientSession().get() method
         :return:                    Requests.Response instance
         """
+        # Omit empty/default values: Wandbox treats absent keys the same and the
+        # payload stays smaller
         params = {
-            'code': code,
-            'codes': codes,
-            'compiler': compiler,
-            'compiler-option-raw': compiler_option_raw,
-            'options': options,
-            'results': results,
-            'runtime-option-raw': runtime_option_raw,
-            'stdin': stdin
+            key: value
+            for key, value in (
+                ('code', code),
+                ('codes', codes),
+                ('compiler', compiler),
+                ('compiler-option-raw', compiler_option_raw),
+                ('options', options),
+                ('results', results),
+                ('runtime-option-raw', runtime_option_raw),
+                ('stdin', stdin)
+            )
+            if value not in (None, '', (), [])
         }
-        # Must update kwargs to prevent conflicting arguments
-        kwargs.update({'params': json.dumps(params)})
-        return await self._post(url=self.url.format("permlink"), **kwargs)
-
-
-@atexit.register
-def _disconnect():
-    """
-    Closes active session
-    :return:
-    """
-
-    async def shutdown():
-        try:
-            await asyncio.gather(*[s.close() for s in Wandbox.active])
-        except Exception as e:
-            raise
-
-    asyncio.run(shutdown())
+        if self.backend == 'httpx':
+            return await self._request_httpx('POST', self._PERMLINK_URL, json=params, **kwargs)
+        session = await type(self).get_session()
+        async with session.post(url=self._PERMLINK_URL, json=params, **kwargs) as response:
+            response.raise_for_status()
+            return await self._parse_response(response)